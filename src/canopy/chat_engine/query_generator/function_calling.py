@@ -1,3 +1,4 @@
+from functools import cached_property
 from typing import List, Optional
 
 from canopy.chat_engine.models import HistoryPruningMethod
@@ -47,9 +48,20 @@ class FunctionCallingQueryGenerator(QueryGenerator):
     async def agenerate(self,
                         messages: Messages,
                         max_prompt_tokens: int) -> List[Query]:
-        raise NotImplementedError
+        # Note: concurrent calls are neither batched nor bounded here - each call
+        # issues its own request. Callers are responsible for limiting concurrency.
+        messages = self._prompt_builder.build(system_prompt=self._system_prompt,
+                                              history=messages,
+                                              max_tokens=max_prompt_tokens)
+        arguments = await self._llm.aenforced_function_call(messages,
+                                                            function=self._function)
+
+        return [Query(text=q)
+                for q in arguments["queries"]]
 
-    @property
+    # The function definition only depends on the (immutable) description, so we
+    # build it once instead of re-creating the pydantic models on every call
+    @cached_property
     def _function(self) -> Function:
         return Function(
             name="query_knowledgebase",
@@ -0,0 +1,52 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+def make_cache_key(**request: Any) -> str:
+    """
+    Build a deterministic cache key from the (JSON-serializable) request arguments.
+    """
+    payload = json.dumps(request, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """
+    A small thread-safe in-memory LRU cache, used for exact-match caching of
+    deterministic LLM responses. A `max_size` of 0 disables the cache.
+    """
+
+    def __init__(self, max_size: int):
+        if max_size < 0:
+            raise ValueError(f"max_size must be a non-negative integer, "
+                             f"got {max_size}")
+        self._max_size = max_size
+        self._data: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self._max_size > 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key: str, value: Any) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self._max_size:
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
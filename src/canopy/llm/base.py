@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Union, Iterable, Optional, List
+from typing import Union, Iterable, Optional, List, AsyncIterable
 
 from canopy.llm.models import Function, ModelParams
 from canopy.models.api_models import ChatResponse, StreamingChatChunk
@@ -45,7 +45,17 @@ class BaseLLM(ABC, ConfigurableMixin):
                                max_generated_tokens: Optional[int] = None,
                                model_params: Optional[ModelParams] = None,
                                ) -> Union[ChatResponse,
-                                          Iterable[StreamingChatChunk]]:
+                                          AsyncIterable[StreamingChatChunk]]:
+        pass
+
+    @abstractmethod
+    async def aenforced_function_call(self,
+                                      messages: Messages,
+                                      function: Function,
+                                      *,
+                                      max_tokens: Optional[int] = None,
+                                      model_params: Optional[ModelParams] = None
+                                      ) -> dict:
         pass
 
     @abstractmethod
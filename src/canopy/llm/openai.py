@@ -1,5 +1,9 @@
-from typing import Union, Iterable, Optional, Any, Dict, List
+from contextlib import asynccontextmanager
+from copy import deepcopy
+from typing import (Union, Iterable, Optional, Any, Dict, List, AsyncIterable,
+                    AsyncIterator, )
 
+import aiohttp
 import jsonschema
 import openai
 import json
@@ -9,11 +13,60 @@ from tenacity import (
     stop_after_attempt,
     retry_if_exception_type,
 )
+from tenacity.wait import wait_base
 from canopy.utils.openai_exceptions import OPEN_AI_TRANSIENT_EXCEPTIONS
 from canopy.llm import BaseLLM
+from canopy.llm._cache import LRUCache, make_cache_key
 from canopy.llm.models import Function, ModelParams
-from canopy.models.api_models import ChatResponse, StreamingChatChunk
-from canopy.models.data_models import Messages, Query
+from canopy.models.api_models import (ChatResponse, StreamingChatChunk,
+                                      _StreamChoice, )
+from canopy.models.data_models import Messages, Query, Role
+
+# Plain dict lookup is cheaper than going through the enum's `.value` descriptor
+_ROLE_NAMES = {role: role.value for role in Role}
+
+
+class _WaitRetryAfter(wait_base):
+    """
+    Tenacity wait strategy that honors the `Retry-After` header sent with
+    rate-limit errors, never waiting less than the given fallback strategy.
+    """
+
+    def __init__(self, fallback: wait_base, max_wait: float = 60):
+        self._fallback = fallback
+        self._max_wait = max_wait
+
+    def __call__(self, retry_state) -> float:
+        fallback_wait = self._fallback(retry_state)
+        exception = retry_state.outcome.exception() if retry_state.outcome else None
+        headers = getattr(exception, "headers", None) or {}
+        retry_after = headers.get("retry-after")
+        if retry_after is None:
+            return fallback_wait
+        try:
+            retry_after_seconds = float(retry_after)
+        except ValueError:
+            return fallback_wait
+        return max(fallback_wait, min(retry_after_seconds, self._max_wait))
+
+
+_retry_transient = retry(
+    reraise=True,
+    wait=_WaitRetryAfter(wait_random_exponential(min=1, max=10)),
+    stop=stop_after_attempt(3),
+    retry=retry_if_exception_type(OPEN_AI_TRANSIENT_EXCEPTIONS),
+)
+
+# Function calls are also retried when the model returns invalid arguments
+_retry_function_call = retry(
+    reraise=True,
+    wait=_WaitRetryAfter(wait_random_exponential(min=1, max=10)),
+    stop=stop_after_attempt(3),
+    retry=retry_if_exception_type(
+        OPEN_AI_TRANSIENT_EXCEPTIONS + (json.decoder.JSONDecodeError,
+                                        jsonschema.ValidationError)
+    ),
+)
 
 
 class OpenAILLM(BaseLLM):
@@ -25,25 +78,55 @@ class OpenAILLM(BaseLLM):
           Or you can directly set it as follows:
           >>> import openai
           >>> openai.api_key = "YOUR_API_KEY"
-    """
+
+    Note: by default, the OpenAI async API opens a new HTTP session (and connection) for every async call.
+          To reuse connections across async calls, use the LLM as an async context manager,
+          which owns a shared aiohttp session and closes it on exit:
+          >>> async with OpenAILLM() as llm:
+          ...     await llm.achat_completion(messages)
+          Alternatively, manage the session yourself by setting `openai.aiosession`.
+    """  # noqa: E501
     def __init__(self,
                  model_name: str = "gpt-3.5-turbo",
                  *,
                  model_params: Optional[ModelParams] = None,
+                 response_cache_size: int = 0,
                  ):
+        """
+        Initialize the OpenAI LLM.
+
+        Args:
+            model_name: The name of the OpenAI model to use. Defaults to "gpt-3.5-turbo".
+            model_params: Default model parameters to use for every request. Defaults to None (uses OpenAI's defaults).
+            response_cache_size: Maximum number of responses to keep in an in-memory exact-match cache.
+                                 Only non-streaming requests with `temperature=0` are cached. Defaults to 0 (caching disabled).
+        """  # noqa: E501
         super().__init__(model_name,
                          model_params=model_params)
+        self._response_cache = LRUCache(response_cache_size)
+        self._aiohttp_session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self) -> "OpenAILLM":
+        if self._aiohttp_session is None or self._aiohttp_session.closed:
+            self._aiohttp_session = aiohttp.ClientSession()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """
+        Close the aiohttp session opened by `async with OpenAILLM() as llm`, if any.
+        """
+        if self._aiohttp_session is not None:
+            await self._aiohttp_session.close()
+            self._aiohttp_session = None
 
     @property
     def available_models(self):
         return [k["id"] for k in openai.Model.list().data]
 
-    @retry(
-        reraise=True,
-        wait=wait_random_exponential(min=1, max=10),
-        stop=stop_after_attempt(3),
-        retry=retry_if_exception_type(OPEN_AI_TRANSIENT_EXCEPTIONS),
-    )
+    @_retry_transient
     def chat_completion(self,
                         messages: Messages,
                         *,
@@ -75,14 +158,18 @@ class OpenAILLM(BaseLLM):
             "I'm good, how are you?"
         """  # noqa: E501
 
-        model_params_dict: Dict[str, Any] = {}
-        model_params_dict.update(
-            **self.default_model_params.dict(exclude_defaults=True)
-        )
-        if model_params:
-            model_params_dict.update(**model_params.dict(exclude_defaults=True))
+        model_params_dict = self._get_model_params_dict(model_params)
+
+        messages = self._format_messages(messages)
+        cache_key = None
+        if not stream:
+            cache_key = self._get_cache_key(model_params_dict,
+                                            messages=messages,
+                                            max_tokens=max_tokens)
+        cached_response = self._get_cached(cache_key)
+        if cached_response is not None:
+            return cached_response
 
-        messages = [m.dict() for m in messages]
         response = openai.ChatCompletion.create(model=self.model_name,
                                                 messages=messages,
                                                 stream=stream,
@@ -91,22 +178,16 @@ class OpenAILLM(BaseLLM):
 
         def streaming_iterator(response):
             for chunk in response:
-                yield StreamingChatChunk(**chunk)
+                yield self._to_streaming_chunk(chunk)
 
         if stream:
             return streaming_iterator(response)
 
-        return ChatResponse(**response)
-
-    @retry(
-        reraise=True,
-        wait=wait_random_exponential(min=1, max=10),
-        stop=stop_after_attempt(3),
-        retry=retry_if_exception_type(
-            OPEN_AI_TRANSIENT_EXCEPTIONS + (json.decoder.JSONDecodeError,
-                                            jsonschema.ValidationError)
-        ),
-    )
+        chat_response = ChatResponse(**response)
+        self._set_cached(cache_key, chat_response)
+        return chat_response
+
+    @_retry_function_call
     def enforced_function_call(self,
                                messages: Messages,
                                function: Function,
@@ -155,14 +236,16 @@ class OpenAILLM(BaseLLM):
         # this enforces the model to call the function
         function_call = {"name": function.name}
 
-        model_params_dict: Dict[str, Any] = {}
-        model_params_dict.update(
-            **self.default_model_params.dict(exclude_defaults=True)
-        )
-        if model_params:
-            model_params_dict.update(**model_params.dict(exclude_defaults=True))
+        model_params_dict = self._get_model_params_dict(model_params)
 
-        messages = [m.dict() for m in messages]
+        messages = self._format_messages(messages)
+        cache_key = self._get_cache_key(model_params_dict,
+                                        messages=messages,
+                                        function=function.dict(),
+                                        max_tokens=max_tokens)
+        cached_arguments = self._get_cached(cache_key)
+        if cached_arguments is not None:
+            return cached_arguments
 
         chat_completion = openai.ChatCompletion.create(
             model=self.model_name,
@@ -173,19 +256,196 @@ class OpenAILLM(BaseLLM):
             **model_params_dict
         )
 
+        arguments = self._parse_function_arguments(chat_completion, function)
+        self._set_cached(cache_key, arguments)
+        return arguments
+
+    @_retry_function_call
+    async def aenforced_function_call(self,
+                                      messages: Messages,
+                                      function: Function,
+                                      *,
+                                      max_tokens: Optional[int] = None,
+                                      model_params: Optional[ModelParams] = None
+                                      ) -> dict:
+        """
+        Async version of `enforced_function_call`, using the OpenAI async API.
+
+        Note: this function is wrapped in a retry decorator to handle transient errors.
+
+        Args:
+            messages: Messages (chat history) to send to the model.
+            function: Function to call. See canopy.llm.models.Function for more details.
+            max_tokens: Maximum number of tokens to generate. Defaults to None (generates until stop sequence or until hitting max context size).
+            model_params: Model parameters to use for this request. Defaults to None (uses the default model parameters).
+
+        Returns:
+            dict: Function call arguments as a dictionary.
+        """  # noqa: E501
+        function_call = {"name": function.name}
+
+        model_params_dict = self._get_model_params_dict(model_params)
+
+        messages = self._format_messages(messages)
+        cache_key = self._get_cache_key(model_params_dict,
+                                        messages=messages,
+                                        function=function.dict(),
+                                        max_tokens=max_tokens)
+        cached_arguments = self._get_cached(cache_key)
+        if cached_arguments is not None:
+            return cached_arguments
+
+        async with self._aiohttp_session_context():
+            chat_completion = await openai.ChatCompletion.acreate(
+                model=self.model_name,
+                messages=messages,
+                functions=[function.dict()],
+                function_call=function_call,
+                max_tokens=max_tokens,
+                **model_params_dict
+            )
+
+        arguments = self._parse_function_arguments(chat_completion, function)
+        self._set_cached(cache_key, arguments)
+        return arguments
+
+    @staticmethod
+    def _to_streaming_chunk(chunk: Dict[str, Any]) -> StreamingChatChunk:
+        # Chunks come straight from the OpenAI API, so we skip pydantic
+        # validation, which would otherwise run for every streamed token
+        choices = [
+            _StreamChoice.construct(
+                index=choice["index"],
+                delta=dict(choice["delta"]),
+                finish_reason=choice.get("finish_reason"),
+            )
+            for choice in chunk["choices"]
+        ]
+        return StreamingChatChunk.construct(id=chunk["id"],
+                                            object=chunk["object"],
+                                            created=chunk["created"],
+                                            model=chunk["model"],
+                                            choices=choices)
+
+    @staticmethod
+    def _parse_function_arguments(chat_completion: Any, function: Function) -> dict:
         result = chat_completion.choices[0].message.function_call
         arguments = json.loads(result["arguments"])
 
         jsonschema.validate(instance=arguments, schema=function.parameters.dict())
         return arguments
 
+    @staticmethod
+    def _format_messages(messages: Messages) -> List[Dict[str, str]]:
+        # Build the request payload directly, avoiding pydantic's `.dict()`
+        # machinery for every message in the (potentially long) chat history
+        return [{"role": _ROLE_NAMES[m.role], "content": m.content} for m in messages]
+
+    def _get_model_params_dict(self,
+                               model_params: Optional[ModelParams]
+                               ) -> Dict[str, Any]:
+        # `.dict()` already returns a fresh dict, so it can be updated in place
+        model_params_dict = self.default_model_params.dict(exclude_defaults=True)
+        if model_params:
+            model_params_dict.update(model_params.dict(exclude_defaults=True))
+        return model_params_dict
+
+    def _get_cache_key(self,
+                       model_params_dict: Dict[str, Any],
+                       **request: Any) -> Optional[str]:
+        # Only deterministic requests (temperature=0) are safe to serve from cache
+        if not self._response_cache.enabled:
+            return None
+        if model_params_dict.get("temperature") != 0:
+            return None
+        return make_cache_key(model=self.model_name, **request, **model_params_dict)
+
+    @asynccontextmanager
+    async def _aiohttp_session_context(self) -> AsyncIterator[None]:
+        # openai only reuses an aiohttp session if `openai.aiosession` is set, so we
+        # set our own session around the call. A session set by the user wins.
+        if self._aiohttp_session is None or openai.aiosession.get() is not None:
+            yield
+            return
+
+        token = openai.aiosession.set(self._aiohttp_session)
+        try:
+            yield
+        finally:
+            openai.aiosession.reset(token)
+
+    def _get_cached(self, cache_key: Optional[str]) -> Optional[Any]:
+        if cache_key is None:
+            return None
+        cached_value = self._response_cache.get(cache_key)
+        # Return a copy, so callers can't mutate the cached value
+        return deepcopy(cached_value) if cached_value is not None else None
+
+    def _set_cached(self, cache_key: Optional[str], value: Any) -> None:
+        if cache_key is not None:
+            self._response_cache.set(cache_key, deepcopy(value))
+
+    @_retry_transient
     async def achat_completion(self,
                                messages: Messages, *, stream: bool = False,
                                max_generated_tokens: Optional[int] = None,
                                model_params: Optional[ModelParams] = None
                                ) -> Union[ChatResponse,
-                                          Iterable[StreamingChatChunk]]:
-        raise NotImplementedError()
+                                          AsyncIterable[StreamingChatChunk]]:
+        """
+        Async chat completion using the OpenAI async API.
+
+        Note: this function is wrapped in a retry decorator to handle transient errors.
+
+        Args:
+            messages: Messages (chat history) to send to the model.
+            stream: Whether to stream the response or not.
+            max_generated_tokens: Maximum number of tokens to generate. Defaults to None (generates until stop sequence or until hitting max context size).
+            model_params: Model parameters to use for this request. Defaults to None (uses the default model parameters).
+
+        Returns:
+            ChatResponse, or an async iterator of StreamingChatChunk if `stream` is True.
+
+        Usage:
+            >>> from canopy.llm import OpenAILLM
+            >>> from canopy.models.data_models import UserMessage
+            >>> llm = OpenAILLM()
+            >>> messages = [UserMessage(content="Hello! How are you?")]
+            >>> result = await llm.achat_completion(messages)
+            >>> print(result.choices[0].message.content)
+            "I'm good, how are you?"
+        """  # noqa: E501
+        model_params_dict = self._get_model_params_dict(model_params)
+
+        messages = self._format_messages(messages)
+        cache_key = None
+        if not stream:
+            cache_key = self._get_cache_key(model_params_dict,
+                                            messages=messages,
+                                            max_tokens=max_generated_tokens)
+        cached_response = self._get_cached(cache_key)
+        if cached_response is not None:
+            return cached_response
+
+        async with self._aiohttp_session_context():
+            response = await openai.ChatCompletion.acreate(
+                model=self.model_name,
+                messages=messages,
+                stream=stream,
+                max_tokens=max_generated_tokens,
+                **model_params_dict
+            )
+
+        async def streaming_iterator(response) -> AsyncIterator[StreamingChatChunk]:
+            async for chunk in response:
+                yield self._to_streaming_chunk(chunk)
+
+        if stream:
+            return streaming_iterator(response)
+
+        chat_response = ChatResponse(**response)
+        self._set_cached(cache_key, chat_response)
+        return chat_response
 
     async def agenerate_queries(self,
                                 messages: Messages,
@@ -1,15 +1,19 @@
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 
+import aiohttp
 import jsonschema
+import openai
 import pytest
 
 
 from canopy.models.data_models import Role, MessageBase # noqa
 from canopy.models.api_models import ChatResponse, StreamingChatChunk # noqa
-from canopy.llm.openai import OpenAILLM # noqa
+from canopy.llm.openai import OpenAILLM, _WaitRetryAfter # noqa
 from canopy.llm.models import \
     Function, FunctionParameters, FunctionArrayProperty, ModelParams # noqa
 from openai import InvalidRequestError # noqa
+from openai.error import RateLimitError # noqa
+from tenacity import wait_fixed # noqa
 
 
 def assert_chat_completion(response, num_choices=1):
@@ -79,6 +83,20 @@ class TestOpenAILLM:
     def openai_llm(model_name):
         return OpenAILLM(model_name=model_name)
 
+    @staticmethod
+    @pytest.fixture
+    def mock_chat_response(model_name):
+        return {
+            "id": "chatcmpl-1",
+            "object": "chat.completion",
+            "created": 0,
+            "model": model_name,
+            "choices": [{"index": 0,
+                         "message": {"role": "assistant", "content": "Hi"},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 5, "completion_tokens": 1},
+        }
+
     @staticmethod
     def test_chat_completion(openai_llm, messages):
         response = openai_llm.chat_completion(messages=messages)
@@ -205,3 +223,297 @@ class TestOpenAILLM:
 
         assert chat_completion.create.call_count == 3, \
             "retry did not happen as expected"
+
+    @staticmethod
+    @patch("openai.ChatCompletion.create")
+    def test_response_cache_hit_for_zero_temperature(mock_api_call,
+                                                     model_name,
+                                                     messages,
+                                                     mock_chat_response):
+        mock_api_call.return_value = mock_chat_response
+        llm = OpenAILLM(model_name=model_name, response_cache_size=4)
+        model_params = ModelParams(temperature=0)
+
+        first = llm.chat_completion(messages=messages, model_params=model_params)
+        second = llm.chat_completion(messages=messages, model_params=model_params)
+
+        assert mock_api_call.call_count == 1
+        assert first == second
+        assert first is not second
+
+    @staticmethod
+    @patch("openai.ChatCompletion.create")
+    def test_response_cache_skipped_for_non_zero_temperature(mock_api_call,
+                                                             model_name,
+                                                             messages,
+                                                             mock_chat_response):
+        mock_api_call.return_value = mock_chat_response
+        llm = OpenAILLM(model_name=model_name, response_cache_size=4)
+        model_params = ModelParams(temperature=0.5)
+
+        llm.chat_completion(messages=messages, model_params=model_params)
+        llm.chat_completion(messages=messages, model_params=model_params)
+
+        assert mock_api_call.call_count == 2
+
+    @staticmethod
+    @patch("openai.ChatCompletion.create")
+    def test_chat_streaming_chunks_format(mock_api_call, openai_llm, messages):
+        mock_api_call.return_value = iter([
+            {"id": "chatcmpl-1", "object": "chat.completion.chunk", "created": 0,
+             "model": "gpt-3.5-turbo", "system_fingerprint": None,
+             "choices": [{"index": 0, "delta": {"role": "assistant", "content": "Hi"},
+                          "finish_reason": None}]},
+            {"id": "chatcmpl-1", "object": "chat.completion.chunk", "created": 0,
+             "model": "gpt-3.5-turbo", "system_fingerprint": None,
+             "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]},
+        ])
+
+        chunks = list(openai_llm.chat_completion(messages=messages, stream=True))
+
+        assert len(chunks) == 2
+        assert all(isinstance(chunk, StreamingChatChunk) for chunk in chunks)
+        assert chunks[0].choices[0].delta["content"] == "Hi"
+        assert chunks[1].choices[0].finish_reason == "stop"
+        assert chunks[0] == StreamingChatChunk.parse_raw(chunks[0].json())
+
+    @staticmethod
+    @pytest.mark.parametrize("headers, expected_wait", [
+        ({"retry-after": "7"}, 7),
+        ({"retry-after": "0"}, 1),
+        ({"retry-after": "3600"}, 60),
+        ({"retry-after": "not-a-number"}, 1),
+        ({}, 1),
+        (None, 1),
+    ])
+    def test_wait_retry_after(headers, expected_wait):
+        retry_state = MagicMock()
+        retry_state.outcome.exception.return_value = RateLimitError(
+            "Rate limit reached", headers=headers
+        )
+        wait = _WaitRetryAfter(wait_fixed(1), max_wait=60)
+        assert wait(retry_state) == expected_wait
+
+    @staticmethod
+    @pytest.mark.asyncio
+    @patch("openai.ChatCompletion.acreate", new_callable=AsyncMock)
+    async def test_achat_completion(mock_api_call,
+                                    openai_llm,
+                                    messages,
+                                    mock_chat_response):
+        mock_api_call.return_value = mock_chat_response
+
+        response = await openai_llm.achat_completion(messages=messages,
+                                                     max_generated_tokens=10)
+
+        assert_chat_completion(response)
+        assert mock_api_call.call_args.kwargs["max_tokens"] == 10
+
+    @staticmethod
+    @pytest.mark.asyncio
+    @patch("openai.ChatCompletion.acreate", new_callable=AsyncMock)
+    async def test_achat_completion_streaming(mock_api_call, openai_llm, messages):
+        async def response():
+            yield {"id": "chatcmpl-1", "object": "chat.completion.chunk",
+                   "created": 0, "model": "gpt-3.5-turbo",
+                   "choices": [{"index": 0, "delta": {"content": "Hi"},
+                                "finish_reason": None}]}
+
+        mock_api_call.return_value = response()
+
+        stream = await openai_llm.achat_completion(messages=messages, stream=True)
+        chunks = [chunk async for chunk in stream]
+
+        assert len(chunks) == 1
+        assert isinstance(chunks[0], StreamingChatChunk)
+        assert chunks[0].choices[0].delta["content"] == "Hi"
+
+    @staticmethod
+    @pytest.mark.asyncio
+    @patch("openai.ChatCompletion.acreate", new_callable=AsyncMock)
+    async def test_aenforced_function_call(mock_api_call,
+                                           openai_llm,
+                                           messages,
+                                           function_query_knowledgebase):
+        mock_api_call.return_value = MagicMock(
+            choices=[MagicMock(
+                message=MagicMock(
+                    function_call={"arguments": "{\"queries\": [\"q1\"]}"}))])
+
+        result = await openai_llm.aenforced_function_call(
+            messages=messages,
+            function=function_query_knowledgebase)
+
+        assert result == {"queries": ["q1"]}
+
+    @staticmethod
+    @pytest.mark.asyncio
+    @patch("openai.ChatCompletion.acreate", new_callable=AsyncMock)
+    async def test_achat_completion_response_cache(mock_api_call,
+                                                   model_name,
+                                                   messages,
+                                                   mock_chat_response):
+        mock_api_call.return_value = mock_chat_response
+        llm = OpenAILLM(model_name=model_name, response_cache_size=4)
+        model_params = ModelParams(temperature=0)
+
+        first = await llm.achat_completion(messages=messages,
+                                           model_params=model_params)
+        second = await llm.achat_completion(messages=messages,
+                                            model_params=model_params)
+
+        assert mock_api_call.call_count == 1
+        assert first == second
+        assert first is not second
+
+    @staticmethod
+    @pytest.mark.asyncio
+    @patch("openai.ChatCompletion.acreate", new_callable=AsyncMock)
+    async def test_aenforced_function_call_response_cache(
+            mock_api_call,
+            model_name,
+            messages,
+            function_query_knowledgebase):
+        mock_api_call.return_value = MagicMock(
+            choices=[MagicMock(
+                message=MagicMock(
+                    function_call={"arguments": "{\"queries\": [\"q1\"]}"}))])
+        llm = OpenAILLM(model_name=model_name, response_cache_size=4)
+        model_params = ModelParams(temperature=0)
+
+        first = await llm.aenforced_function_call(
+            messages=messages,
+            function=function_query_knowledgebase,
+            model_params=model_params)
+        first["queries"].append("mutated")
+        second = await llm.aenforced_function_call(
+            messages=messages,
+            function=function_query_knowledgebase,
+            model_params=model_params)
+
+        assert mock_api_call.call_count == 1
+        assert second == {"queries": ["q1"]}
+
+    @staticmethod
+    @pytest.fixture
+    def aiohttp_sessions():
+        # Track every aiohttp session opened during the test, and make sure none
+        # of them is left open when the test ends
+        sessions = []
+
+        def make_session(*args, **kwargs):
+            session = real_client_session(*args, **kwargs)
+            sessions.append(session)
+            return session
+
+        real_client_session = aiohttp.ClientSession
+        with patch("aiohttp.ClientSession", side_effect=make_session):
+            yield sessions
+        assert all(session.closed for session in sessions), \
+            "aiohttp session was left open"
+
+    @staticmethod
+    @pytest.fixture
+    def recorded_aiosessions(mock_chat_response):
+        # Records the value of `openai.aiosession` seen by each OpenAI async call
+        sessions = []
+
+        async def acreate(**kwargs):
+            sessions.append(openai.aiosession.get())
+            return mock_chat_response
+
+        with patch("openai.ChatCompletion.acreate", side_effect=acreate):
+            yield sessions
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_async_calls_without_context_manager_open_no_session(
+            openai_llm,
+            messages,
+            aiohttp_sessions,
+            recorded_aiosessions):
+        await openai_llm.achat_completion(messages=messages)
+
+        # openai falls back to its own per-call session
+        assert recorded_aiosessions == [None]
+        assert aiohttp_sessions == []
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_async_context_manager_reuses_and_closes_session(
+            openai_llm,
+            messages,
+            aiohttp_sessions,
+            recorded_aiosessions):
+        async with openai_llm as llm:
+            await llm.achat_completion(messages=messages)
+            await llm.achat_completion(messages=messages)
+            # The session is only set for the duration of the OpenAI call
+            assert openai.aiosession.get() is None
+
+        assert len(aiohttp_sessions) == 1
+        assert recorded_aiosessions == [aiohttp_sessions[0]] * 2
+        assert aiohttp_sessions[0].closed
+        assert openai_llm._aiohttp_session is None
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_async_calls_respect_user_aiohttp_session(openai_llm,
+                                                            messages,
+                                                            aiohttp_sessions,
+                                                            recorded_aiosessions):
+        async with openai_llm as llm, aiohttp.ClientSession() as user_session:
+            token = openai.aiosession.set(user_session)
+            try:
+                await llm.achat_completion(messages=messages)
+            finally:
+                openai.aiosession.reset(token)
+
+        assert recorded_aiosessions == [user_session]
+
+    @staticmethod
+    @pytest.mark.asyncio
+    @patch("openai.ChatCompletion.acreate", new_callable=AsyncMock)
+    async def test_achat_completion_retries_transient_errors(mock_api_call,
+                                                             openai_llm,
+                                                             messages,
+                                                             mock_chat_response):
+        rate_limit_error = RateLimitError("Rate limit reached",
+                                          headers={"retry-after": "5"})
+        mock_api_call.side_effect = [rate_limit_error, rate_limit_error,
+                                     mock_chat_response]
+
+        with patch.object(OpenAILLM.achat_completion.retry, "sleep",
+                          new_callable=AsyncMock) as mock_sleep:
+            response = await openai_llm.achat_completion(messages=messages)
+
+        assert_chat_completion(response)
+        assert mock_api_call.call_count == 3, "retry did not happen as expected"
+        assert [c.args[0] for c in mock_sleep.await_args_list] == [5, 5]
+
+    @staticmethod
+    @pytest.mark.asyncio
+    @patch("openai.ChatCompletion.acreate", new_callable=AsyncMock)
+    async def test_aenforced_function_call_retries_transient_errors(
+            mock_api_call,
+            openai_llm,
+            messages,
+            function_query_knowledgebase):
+        rate_limit_error = RateLimitError("Rate limit reached",
+                                          headers={"retry-after": "5"})
+        mock_api_call.side_effect = [
+            rate_limit_error,
+            rate_limit_error,
+            MagicMock(choices=[MagicMock(message=MagicMock(
+                function_call={"arguments": "{\"queries\": [\"q1\"]}"}))]),
+        ]
+
+        with patch.object(OpenAILLM.aenforced_function_call.retry, "sleep",
+                          new_callable=AsyncMock) as mock_sleep:
+            result = await openai_llm.aenforced_function_call(
+                messages=messages,
+                function=function_query_knowledgebase)
+
+        assert result == {"queries": ["q1"]}
+        assert mock_api_call.call_count == 3, "retry did not happen as expected"
+        assert [c.args[0] for c in mock_sleep.await_args_list] == [5, 5]
@@ -0,0 +1,62 @@
+import pytest
+
+from canopy.llm._cache import LRUCache, make_cache_key
+
+
+def test_get_missing_key_returns_none():
+    cache = LRUCache(2)
+    assert cache.get("missing") is None
+
+
+def test_set_and_get():
+    cache = LRUCache(2)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    assert len(cache) == 1
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    # Accessing "a" makes "b" the least recently used entry
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_set_existing_key_refreshes_entry():
+    cache = LRUCache(2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.set("a", 10)
+    cache.set("c", 3)
+
+    assert cache.get("a") == 10
+    assert cache.get("b") is None
+
+
+def test_zero_max_size_disables_cache():
+    cache = LRUCache(0)
+    assert not cache.enabled
+    cache.set("a", 1)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_negative_max_size_raises():
+    with pytest.raises(ValueError, match="non-negative"):
+        LRUCache(-1)
+
+
+def test_make_cache_key_is_order_independent():
+    key = make_cache_key(model="m", messages=[{"role": "user", "content": "hi"}])
+    same_key = make_cache_key(messages=[{"role": "user", "content": "hi"}], model="m")
+    other_key = make_cache_key(model="m", messages=[{"role": "user", "content": "yo"}])
+
+    assert key == same_key
+    assert key != other_key
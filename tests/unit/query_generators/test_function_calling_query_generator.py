@@ -137,6 +137,21 @@ class TestFunctionCallingQueryGenerator:
         args, kwargs = mock_llm.enforced_function_call.call_args
         assert kwargs['function'] == expected_function
 
+    @staticmethod
+    def test_generate_reuses_function_definition(query_generator,
+                                                 mock_llm,
+                                                 mock_prompt_builder,
+                                                 sample_messages
+                                                 ):
+        mock_prompt_builder.build.return_value = sample_messages
+        mock_llm.enforced_function_call.return_value = {"queries": ["query1"]}
+
+        query_generator.generate(messages=sample_messages, max_prompt_tokens=100)
+        query_generator.generate(messages=sample_messages, max_prompt_tokens=100)
+
+        first_call, second_call = mock_llm.enforced_function_call.call_args_list
+        assert first_call.kwargs['function'] is second_call.kwargs['function']
+
     @staticmethod
     def test_generate_invalid_return_from_llm(query_generator,
                                               mock_llm,
@@ -152,11 +167,27 @@ class TestFunctionCallingQueryGenerator:
 
     @staticmethod
     @pytest.mark.asyncio
-    async def test_agenerate_not_implemented(query_generator,
-                                             mock_llm,
-                                             mock_prompt_builder,
-                                             sample_messages
-                                             ):
-        with pytest.raises(NotImplementedError):
-            await query_generator.agenerate(messages=sample_messages,
-                                            max_prompt_tokens=100)
+    async def test_agenerate_with_default_params(query_generator,
+                                                 mock_llm,
+                                                 mock_prompt_builder,
+                                                 sample_messages
+                                                 ):
+        mock_prompt_builder.build.return_value = sample_messages
+        mock_llm.aenforced_function_call.return_value = {
+            "queries": ["query1", "query2"]
+        }
+
+        result = await query_generator.agenerate(messages=sample_messages,
+                                                 max_prompt_tokens=100)
+
+        mock_prompt_builder.build.assert_called_once_with(
+            system_prompt=DEFAULT_SYSTEM_PROMPT,
+            history=sample_messages,
+            max_tokens=100
+        )
+        assert mock_llm.aenforced_function_call.called
+        args, kwargs = mock_llm.aenforced_function_call.call_args
+        assert kwargs['function'] == query_generator._function
+        assert not mock_llm.enforced_function_call.called
+
+        assert result == [Query(text="query1"), Query(text="query2")]